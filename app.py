@@ -1,19 +1,121 @@
-from fastapi import FastAPI, UploadFile, File
+from fastapi import Depends, FastAPI, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import io
+import os
+import asyncio
+import tempfile
+import threading
+
+# numba writes its cache next to the source by default, which fails on read-only images
+os.environ.setdefault("NUMBA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "numba_cache"))
+from numba import njit, types
 import pdfplumber
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 
-from database import SessionLocal, engine
+from database import INSERT_BATCH_SIZE, engine, get_db
 from models import Base, Transaction
+from schemas import AnalysisResponse
 
 
 app = FastAPI(title="SME Financial Health API")
 
+RISK_TABLE = {
+    "LOW": {"multiplier": 12, "tenure_months": 24, "interest_rate": "10–12%"},
+    "MEDIUM": {"multiplier": 6, "tenure_months": 18, "interest_rate": "13–16%"},
+    "HIGH": {"multiplier": 3, "tenure_months": 18, "interest_rate": "13–16%"},
+}
+
+
+def readonly_array(dtype):
+    return types.Array(dtype, 1, "C", readonly=True)
+
+
+# an explicit signature compiles (or loads from cache) at import, so the first request doesn't
+# pay for it; read-only arrays also accept writable ones, and pandas copy-on-write hands out
+# read-only views from to_numpy()
+@njit(
+    [(readonly_array(types.float64), readonly_array(types.int32), readonly_array(types.int8), types.int64)],
+    cache=True
+)
+def monthly_totals(amount, month_idx, type_code, n_months):
+    # type_code: 0 = income, 1 = expense, -1 = anything else
+    income = np.zeros(n_months)
+    expense = np.zeros(n_months)
+    count = np.zeros(n_months, dtype=np.int64)
+    for i in range(amount.shape[0]):
+        m = month_idx[i]
+        count[m] += 1
+        if type_code[i] == 0:
+            income[m] += amount[i]
+        elif type_code[i] == 1:
+            expense[m] += amount[i]
+    return income, expense, count
+
+
+CSV_CONVERT_OPTIONS = pacsv.ConvertOptions(column_types={"date": pa.string()}, strings_can_be_null=True)
+
+
+def read_csv_upload(contents: bytes):
+    # date is read as text: pyarrow's own timestamp inference converts offsets to UTC,
+    # and pandas' dtype= hint is only applied after that conversion
+    df = pacsv.read_csv(io.BytesIO(contents), convert_options=CSV_CONVERT_OPTIONS)
+    df = df.to_pandas(types_mapper=pd.ArrowDtype)
+    # columns with no values (e.g. a header-only file) come back as null[pyarrow]
+    return df.astype({c: "string[pyarrow]" for c, t in df.dtypes.items() if t == pd.ArrowDtype(pa.null())})
+
+
+def read_pdf_table(contents: bytes):
+    header, rows = None, []
+    with pdfplumber.open(io.BytesIO(contents)) as pdf:
+        for page in pdf.pages:
+            for table in page.extract_tables():
+                if header is None:
+                    header, table = table[0], table[1:]
+                rows.extend(r for r in table if r != header)
+    if header is None:
+        return None
+    return pd.DataFrame(rows, columns=header)
+
+
+# trailing "Z" / "+05:30" after a time of day
+UTC_OFFSET_SUFFIX = r"(\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)(?:Z|[+-]\d{2}:?\d{2})$"
+
+TYPE_CODES = pd.Index(["income", "expense"])
+
+TXN_COLUMNS = ["date", "industry", "category", "amount", "type"]
+INSERT_TXN = insert(Transaction)
+
+
+def insert_transactions(db: Session, rows: pd.DataFrame):
+    if db.get_bind().dialect.driver == "psycopg2":
+        # COPY streams every row in one protocol message
+        buffer = io.StringIO()
+        rows.to_csv(buffer, index=False, header=False, date_format="%Y-%m-%d")
+        buffer.seek(0)
+        cursor = db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {Transaction.__tablename__} ({', '.join(TXN_COLUMNS)}) FROM STDIN WITH CSV",
+                buffer
+            )
+        finally:
+            cursor.close()
+    else:
+        # plain Python values; drivers can't bind pd.NA or pandas Timestamps for a Date column
+        records = rows.assign(date=rows["date"].dt.date).astype(object)
+        records = records.where(records.notna(), None).to_dict(orient="records")
+        for i in range(0, len(records), INSERT_BATCH_SIZE):
+            db.execute(INSERT_TXN, records[i:i + INSERT_BATCH_SIZE])
+    db.commit()
+
 Base.metadata.create_all(bind=engine)
 
 
@@ -31,51 +133,64 @@ def home():
     return {"status": "Backend running fine ✅"}
 
 
-@app.post("/analyze/final-report")
-async def analyze_financials(file: UploadFile = File(...)):
+@app.post("/analyze/final-report", response_model=AnalysisResponse)
+async def analyze_financials(file: UploadFile = File(...), db: Session = Depends(get_db)):
 
     contents = await file.read()
     filename = file.filename.lower()
 
     
     if filename.endswith(".csv"):
-        df = pd.read_csv(io.StringIO(contents.decode("utf-8")))
+        try:
+            df = await asyncio.to_thread(read_csv_upload, contents)
+        except pa.ArrowInvalid as e:
+            return {"error": f"Could not parse CSV: {e}"}
 
     elif filename.endswith(".xlsx"):
-        df = pd.read_excel(io.BytesIO(contents), engine="openpyxl")
+        df = await asyncio.to_thread(pd.read_excel, io.BytesIO(contents), engine="openpyxl")
 
     elif filename.endswith(".pdf"):
-        text_data = []
-        with pdfplumber.open(io.BytesIO(contents)) as pdf:
-            for page in pdf.pages:
-                text_data.append(page.extract_text())
-        text = "\n".join(text_data)
-        df = pd.read_csv(io.StringIO(text))
+        df = await asyncio.to_thread(read_pdf_table, contents)
+        if df is None:
+            return {"error": "No table found in PDF"}
 
     else:
         return {"error": "Unsupported file format"}
 
    
-    df["amount"] = pd.to_numeric(df["amount"], errors="coerce").fillna(0)
-    df["type"] = df["type"].str.lower().str.strip()
-    df["date"] = pd.to_datetime(df["date"])
+    # plain float64 so that coerced NaNs (which fillna skips in double[pyarrow]) become 0
+    df["amount"] = pd.to_numeric(df["amount"], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    df["amount"] = df["amount"].fillna(0)
+    df["type"] = df["type"].astype("string").str.lower().str.strip()
+    for col in ("industry", "category"):
+        if col in df:
+            df[col] = df[col].astype("string[pyarrow]")
+    raw_dates = df["date"]
+    try:
+        dates = pd.to_datetime(raw_dates, format="ISO8601", cache=True, errors="coerce")
+    except ValueError:
+        dates = None
+    if dates is None or dates.dtype == object:
+        # mixed UTC offsets (e.g. either side of DST) can't share one tz: keep each row's wall time
+        raw_dates = raw_dates.astype("string").str.replace(UTC_OFFSET_SUFFIX, r"\1", regex=True)
+        dates = pd.to_datetime(raw_dates, format="ISO8601", cache=True, errors="coerce")
+    if (dates.isna() & raw_dates.notna()).any():
+        # not ISO: let pandas infer the format from the data instead
+        dates = pd.to_datetime(raw_dates, cache=True, errors="coerce")
+    df["date"] = dates
+    # blank or unparseable dates are kept (stored as NULL) but can't be binned by month
+    has_date = df["date"].notna().to_numpy()
 
     
-    db: Session = SessionLocal()
-    for _, row in df.iterrows():
-        db.add(Transaction(
-            date=row["date"],
-            industry=row.get("industry", "General"),
-            category=row.get("category", "General"),
-            amount=float(row["amount"]),
-            type=row["type"]
-        ))
-    db.commit()
-    db.close()
+    await asyncio.to_thread(insert_transactions, db, df.assign(
+        industry=df.get("industry", "General"),
+        category=df.get("category", "General")
+    )[TXN_COLUMNS])
 
     # ---------- METRICS ----------
-    total_income = float(df[df["type"] == "income"]["amount"].sum())
-    total_expense = float(df[df["type"] == "expense"]["amount"].sum())
+    sums = df.groupby("type", sort=False, observed=True)["amount"].sum()
+    total_income = float(sums.get("income", 0.0))
+    total_expense = float(sums.get("expense", 0.0))
     net_profit = total_income - total_expense
     profit_margin = round((net_profit / total_income) * 100, 2) if total_income > 0 else 0
 
@@ -96,20 +211,37 @@ async def analyze_financials(file: UploadFile = File(...)):
     credit = min(100, credit)
 
     # ---------- MONTHLY ----------
-    df["month"] = df["date"].dt.to_period("M").astype(str)
-    monthly = df.groupby(["month", "type"])["amount"].sum().unstack().fillna(0)
-    monthly["cashflow"] = monthly.get("income", 0) - monthly.get("expense", 0)
+    # months since 1970-01, straight from the datetime64 buffer (in local wall time)
+    dates = df["date"]
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_localize(None)
+    month_key = dates.to_numpy()[has_date].astype("datetime64[M]").astype(np.int32)
+    # 0 = income, 1 = expense, -1 = any other type
+    type_code = TYPE_CODES.get_indexer(df["type"]).astype(np.int8)[has_date]
+
+    first_month = int(month_key.min()) if len(month_key) else 0
+    n_months = int(month_key.max()) - first_month + 1 if len(month_key) else 0
+    income, expense, count = monthly_totals(
+        df["amount"].to_numpy(dtype=np.float64)[has_date], month_key - first_month, type_code, n_months
+    )
+
+    seen = np.flatnonzero(count)
+    labels = [f"{1970 + (first_month + k) // 12}-{(first_month + k) % 12 + 1:02d}" for k in seen]
+    monthly = [
+        {"month": m, "income": float(i), "expense": float(e), "cashflow": float(i - e)}
+        for m, i, e in zip(labels, income[seen], expense[seen])
+    ]
 
     # ---------- LOAN ----------
     eligibility = "YES" if credit >= 75 else "MAYBE" if credit >= 55 else "NO"
     avg_profit = net_profit / max(len(monthly), 1)
-    multiplier = 12 if risk == "LOW" else 6 if risk == "MEDIUM" else 3
+    params = RISK_TABLE[risk]
 
     loan = {
         "eligible": eligibility,
-        "recommended_amount": int(avg_profit * multiplier) if eligibility != "NO" else 0,
-        "tenure_months": 24 if risk == "LOW" else 18,
-        "interest_rate_estimate": "10–12%" if risk == "LOW" else "13–16%",
+        "recommended_amount": int(avg_profit * params["multiplier"]) if eligibility != "NO" else 0,
+        "tenure_months": params["tenure_months"],
+        "interest_rate_estimate": params["interest_rate"],
         "risk_level": risk,
         "confidence_score": credit
     }
@@ -122,7 +254,8 @@ async def analyze_financials(file: UploadFile = File(...)):
             "profit_margin_percent": profit_margin,
             "credit_score": credit
         },
-        "monthly_cashflow": monthly.reset_index().to_dict(orient="records"),
+        "monthly_cashflow": monthly,
+        "rows_without_date": int(len(df) - has_date.sum()),
         "loan_recommendation": loan,
         "ai_summary": {
             "english": f"Business earned ₹{total_income:,.0f}, profit ₹{net_profit:,.0f}. Loan eligibility {eligibility}.",
@@ -132,39 +265,97 @@ async def analyze_financials(file: UploadFile = File(...)):
     }
 
 
-@app.post("/download-pdf")
-async def download_pdf(data: dict):
+PDF_CHUNK_SIZE = 64 * 1024
+PDF_QUEUE_SIZE = 8
 
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
 
-    y = height - 40
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(50, y, "SME Financial Health Report")
+class QueueWriter:
+    """File-like sink that feeds written bytes into a bounded asyncio.Queue from a worker thread.
+
+    write() blocks while the queue is full, so the renderer can't run ahead of the client.
+    """
+
+    def __init__(self, loop, queue):
+        self._loop = loop
+        self._queue = queue
+        self._cancelled = threading.Event()
+
+    def _put(self, item):
+        if not self._cancelled.is_set():
+            asyncio.run_coroutine_threadsafe(self._queue.put(item), self._loop).result()
 
-    c.setFont("Helvetica", 12)
-    y -= 40
+    def write(self, data):
+        view = memoryview(data)
+        for i in range(0, len(view), PDF_CHUNK_SIZE):
+            self._put(bytes(view[i:i + PDF_CHUNK_SIZE]))
+        return len(view)
 
-    for k, v in data["investor_metrics"].items():
-        c.drawString(50, y, f"{k.replace('_',' ').title()}: {v}")
-        y -= 18
+    def flush(self):
+        pass
 
-    y -= 20
-    c.setFont("Helvetica-Bold", 13)
-    c.drawString(50, y, "Loan Recommendation")
-    y -= 20
+    def close(self):
+        self._put(None)
 
-    for k, v in data["loan_recommendation"].items():
-        c.drawString(50, y, f"{k.replace('_',' ').title()}: {v}")
-        y -= 15
+    def cancel(self):
+        # called on the event loop when the client goes away; unblocks a waiting write()
+        self._cancelled.set()
+        while not self._queue.empty():
+            self._queue.get_nowait()
 
+
+def render_report(data: dict, out):
+    c = canvas.Canvas(out, pagesize=A4)
+    width, height = A4
+
+    text = c.beginText(50, height - 40)
+    text.setFont("Helvetica-Bold", 16, leading=40)
+    text.textLine("SME Financial Health Report")
+
+    text.setFont("Helvetica", 12, leading=18)
+    text.textLines([f"{k.replace('_',' ').title()}: {v}" for k, v in data["investor_metrics"].items()])
+
+    text.moveCursor(0, 20)
+    text.setFont("Helvetica-Bold", 13, leading=20)
+    text.textLine("Loan Recommendation")
+
+    text.setLeading(15)
+    text.textLines([f"{k.replace('_',' ').title()}: {v}" for k, v in data["loan_recommendation"].items()])
+
+    c.drawText(text)
     c.save()
-    buffer.seek(0)
+
+
+@app.post("/download-pdf")
+async def download_pdf(data: dict):
+
+    queue = asyncio.Queue(maxsize=PDF_QUEUE_SIZE)
+    pipe = QueueWriter(asyncio.get_running_loop(), queue)
+
+    def build():
+        try:
+            render_report(data, pipe)
+        finally:
+            pipe.close()
+
+    task = asyncio.create_task(asyncio.to_thread(build))
+
+    # wait for output before sending headers, so a render error still surfaces as a 500
+    first = await queue.get()
+    if first is None:
+        await task
+
+    async def stream():
+        try:
+            chunk = first
+            while chunk is not None:
+                yield chunk
+                chunk = await queue.get()
+            await task
+        finally:
+            pipe.cancel()
 
     return StreamingResponse(
-        buffer,
+        stream(),
         media_type="application/pdf",
         headers={"Content-Disposition": "attachment; filename=SME_Report.pdf"}
     )
-
@@ -1,12 +1,22 @@
 import os
 from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
 from sqlalchemy.orm import sessionmaker, declarative_base
 
-DATABASE_URL = os.getenv("DATABASE_URL")
+DATABASE_URL = os.environ["DATABASE_URL"]
+
+INSERT_BATCH_SIZE = 1000
+
+if os.getenv("SERVERLESS"):
+    # short-lived workers never get to reuse pooled connections
+    pool_options = {"poolclass": NullPool}
+else:
+    pool_options = {"pool_pre_ping": True, "pool_size": 10, "max_overflow": 20}
 
 engine = create_engine(
     DATABASE_URL,
-    pool_pre_ping=True
+    insertmanyvalues_page_size=INSERT_BATCH_SIZE,
+    **pool_options
 )
 
 SessionLocal = sessionmaker(
@@ -16,3 +26,12 @@ SessionLocal = sessionmaker(
 )
 
 Base = declarative_base()
+
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
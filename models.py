@@ -1,11 +1,14 @@
-from sqlalchemy import Column, Integer, Float, String, Date
+from sqlalchemy import Column, Integer, Float, String, Date, Index
 from database import Base
 
 class Transaction(Base):
     __tablename__ = "transactions"
+    __table_args__ = (
+        Index("ix_txn_type_date", "type", "date"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    date = Column(Date)
+    date = Column(Date, index=True)
     industry = Column(String(100))
     category = Column(String(100))
     amount = Column(Float)
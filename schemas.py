@@ -0,0 +1,48 @@
+from typing import List, Union
+
+from pydantic import BaseModel
+
+
+class InvestorMetrics(BaseModel):
+    total_income: float
+    total_expense: float
+    net_profit: float
+    profit_margin_percent: float
+    credit_score: int
+
+
+class MonthlyCashflow(BaseModel):
+    month: str
+    income: float
+    expense: float
+    cashflow: float
+
+
+class LoanRecommendation(BaseModel):
+    eligible: str
+    recommended_amount: int
+    tenure_months: int
+    interest_rate_estimate: str
+    risk_level: str
+    confidence_score: int
+
+
+class AISummary(BaseModel):
+    english: str
+    tamil: str
+    hindi: str
+
+
+class FinancialReport(BaseModel):
+    investor_metrics: InvestorMetrics
+    monthly_cashflow: List[MonthlyCashflow]
+    rows_without_date: int
+    loan_recommendation: LoanRecommendation
+    ai_summary: AISummary
+
+
+class ErrorResponse(BaseModel):
+    error: str
+
+
+AnalysisResponse = Union[FinancialReport, ErrorResponse]
\ No newline at end of file